@@ -0,0 +1,118 @@
+"""Extract tarballs and zip archives."""
+
+import os.path
+import posixpath
+import re
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+
+def extract(path, target, exclude=()):
+    """Extract an archive into the target directory.
+
+    The longest common prefix of all member names is stripped. Members with a path that matches
+    one of the exclude patterns are skipped.
+    """
+    if zipfile.is_zipfile(path):
+        extract_zip(path, target, exclude)
+    else:
+        extract_tar(path, target, exclude)
+
+
+def target_paths(names, exclude=()):
+    """Map archive member names to their paths relative to the target directory.
+
+    The longest common prefix of all names is stripped. Members that would end up outside
+    of the target directory or that match one of the exclude patterns are omitted.
+    """
+    names = [n for n in names if not n.startswith("/") and ".." not in n.split("/")]
+    prefix = len(os.path.commonprefix(names))
+    exclude_patterns = [re.compile(p) for p in exclude]
+    paths = {}
+    for name in names:
+        if len(name) <= prefix:
+            continue
+        path = name[prefix:]
+        if path.startswith("/"):
+            path = path[1:]
+        if any(p.search(path) for p in exclude_patterns):
+            continue
+        paths[name] = path
+    return paths
+
+
+def extract_zip(path, target, exclude=()):
+    """Extract a zip archive into the target directory."""
+    with zipfile.ZipFile(path) as archive:
+        paths = target_paths(archive.namelist(), exclude)
+        for info in archive.infolist():
+            if info.filename not in paths:
+                continue
+            dest = os.path.join(target, paths[info.filename])
+            if info.is_dir():
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with archive.open(info) as src, open(dest, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+
+
+def extract_tar(path, target, exclude=()):
+    """Extract a (compressed) tarball into the target directory.
+
+    The archive is decompressed only once: Since the common prefix is only known after all
+    members have been read, files are extracted into a staging directory within the target
+    first and then moved to their final location. Links are resolved and their targets are
+    copied as regular files.
+    """
+    # Staging inside the target means an aborted build leaves nothing behind next to it.
+    os.makedirs(target, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".extract-", dir=target)
+    try:
+        members = {}
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.name.startswith("/") or ".." in member.name.split("/"):
+                    continue
+                members[member.name] = member
+                if member.isfile():
+                    staged = os.path.join(staging, member.name)
+                    os.makedirs(os.path.dirname(staged), exist_ok=True)
+                    with archive.extractfile(member) as src, open(staged, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.utime(staged, (member.mtime, member.mtime))
+
+        # Links are copied first so that the files they point to are still in place.
+        moves = []
+        for name, rel_path in target_paths(list(members), exclude).items():
+            member = resolve_tar_member(members, members[name])
+            if member is None:
+                continue
+            dest = os.path.join(target, rel_path)
+            if member.isdir():
+                os.makedirs(dest, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            src = os.path.join(staging, member.name)
+            if member.name == name:
+                moves.append((src, dest))
+            else:
+                shutil.copy2(src, dest)
+        for src, dest in moves:
+            os.replace(src, dest)
+    finally:
+        shutil.rmtree(staging)
+
+
+def resolve_tar_member(members, member):
+    """Follow (sym)links until a regular file or directory is found."""
+    while member.islnk() or member.issym():
+        linkpath = member.linkname
+        if member.issym():
+            linkpath = posixpath.normpath(posixpath.join(posixpath.dirname(member.name), linkpath))
+        member = members.get(linkpath)
+        if member is None:
+            return None
+    return member if member.isfile() or member.isdir() else None
@@ -2,43 +2,54 @@
 
 import abc
 import collections
+import collections.abc
 import hashlib
 import json
 import os.path
 import re
 import shutil
-import urllib.parse
-import urllib.request
+import threading
 from copy import copy, deepcopy
-from functools import partial
-from glob import glob
+from functools import cached_property
 
-import setuptools.archive_util
+from drupy import archives, utils
 
-from drupy import utils
+# Values of these types can be shared between configs without copying them.
+immutable_types = (str, int, float, type(None), tuple, frozenset)
+
+# Marker for keys missing from a config.
+missing = object()
 
 
 def add_defaults(config, defaults):
     """Recursively merge defaults into a config dictionary."""
-    queue = [(config, defaults)]
-
-    while len(queue) > 0:
-        c, d = queue.pop(0)
-        for k in d.keys():
-            if k in c:
-                if isinstance(c[k], dict) and isinstance(d[k], dict):
-                    queue.append((c[k], d[k]))
-            else:
-                c[k] = deepcopy(d[k])
+    queue = collections.deque([(config, defaults)])
+
+    while queue:
+        c, d = queue.popleft()
+        for k, v in d.items():
+            current = c.get(k, missing)
+            if current is missing:
+                # Mutable defaults are copied so that changes to the config don’t leak into them.
+                # Empty containers (the most common mutable defaults) only need a shallow copy.
+                if isinstance(v, immutable_types):
+                    c[k] = v
+                elif not v:
+                    c[k] = copy(v)
+                else:
+                    c[k] = deepcopy(v)
+            elif v and isinstance(current, dict) and isinstance(v, dict):
+                queue.append((current, v))
 
 
-parsers = {".json": partial(json.load, object_pairs_hook=collections.OrderedDict)}
+parsers = {".json": json.load}
 
 # Optionally load support for yaml config files.
 try:
     import ruamel.yaml
 
-    yaml = ruamel.yaml.YAML(typ="safe", pure=True)
+    # Uses the libyaml based C loader if ruamel.yaml.clib is installed.
+    yaml = ruamel.yaml.YAML(typ="safe")
     parsers[".yaml"] = yaml.load
 except ImportError:
     pass
@@ -63,30 +74,71 @@ class Config:
 
     def read_config(self):
         """Read the config, fetch referenced remote config and add defaults."""
-        o = self.runner.options
         files = [(None, self.path)]
-        data = collections.OrderedDict()
-        while len(files) > 0:
-            rel_to, path = files.pop(0)
-            path = (
-                self.runner.get_downloader({"url": path})
-                .download(rel_to, o.download_dir)
-                .localpath()
-            )
-            new_data = self.read_file(path)
-            if "includes" in new_data:
-                includes = new_data["includes"]
-                del new_data["includes"]
-                rel_to = os.path.dirname(path)
-                for inc in includes:
-                    files.append((rel_to, inc))
-            add_defaults(data, new_data)
+        data = {}
+        # Process the includes level by level: All files included on the same level are downloaded
+        # concurrently but merged in the order they are listed.
+        while files:
+            if len(files) > 1:
+                pool = self.runner.state.download_pool
+                paths = [f.result() for f in [pool.submit(self.fetch, *args) for args in files]]
+            else:
+                paths = [self.fetch(*files[0])]
+            files = []
+            for path in paths:
+                new_data = self.read_file(path)
+                includes = new_data.pop("includes", None)
+                if includes:
+                    rel_to = os.path.dirname(path)
+                    for inc in includes:
+                        files.append((rel_to, inc))
+                add_defaults(data, new_data)
         add_defaults(data, self.defaults)
         return data
 
+    def fetch(self, rel_to, path):
+        """Download a config file and return its local path."""
+        downloader = self.runner.get_downloader({"url": path})
+        return downloader.download(rel_to, self.runner.options.download_dir).localpath()
+
     def read_file(self, path):
-        """Read config from a file."""
+        """Read config from a file.
+
+        Parsing YAML is slow so the parsed data is cached as JSON in the download directory until
+        the file is modified.
+        """
         parser = get_parser(path)
+        if parser is json.load:
+            return self.parse_file(path, parser)
+
+        st = os.stat(path)
+        key = [st.st_mtime_ns, st.st_size]
+        cache_dir = os.path.join(self.runner.options.download_dir, ".parsed")
+        cache_path = os.path.join(
+            cache_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + ".json"
+        )
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["key"] == key:
+                return cached["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        data = self.parse_file(path, parser)
+        try:
+            # Only cache data that survives the conversion to JSON unchanged (ie. no int keys).
+            if json.loads(json.dumps(data)) == data:
+                os.makedirs(cache_dir, exist_ok=True)
+                utils.write_json(cache_path, {"key": key, "data": data})
+        except (OSError, ValueError, TypeError):
+            # Not being able to cache the data is not a reason to fail.
+            pass
+        return data
+
+    @staticmethod
+    def parse_file(path, parser):
+        """Parse a config file using the parser."""
         with open(path, encoding="utf-8") as configfile:
             try:
                 return parser(configfile)
@@ -105,40 +157,74 @@ class Tree(Config):
         "projects": {},
     }
 
+    # Site configs are named <site>.site.<ext> and live next to the tree config.
+    site_pattern = re.compile(r"([^.]+)\.site\.[^.]+")
+
     def __init__(self, runner, path):
         """Create a new tree instance."""
         Config.__init__(self, runner, path)
-        self.projects = collections.OrderedDict()
+        self.projects = {}
         for dirname, config in self.config["projects"].items():
             config["dirname"] = dirname
             self.projects[dirname] = runner.get_project(config)
 
-        self.sites = {}
-        for configpath in glob(os.path.dirname(path) + "/*.site.*"):
-            basename = os.path.basename(configpath)
-            site = basename[: basename.find(".")]
-            if "." not in site:
-                self.sites[site] = Site(self.runner, site, configpath)
+        site_paths = {}
+        with os.scandir(os.path.dirname(path) or ".") as entries:
+            for entry in entries:
+                match = self.site_pattern.fullmatch(entry.name)
+                if match and entry.is_file():
+                    site_paths[match.group(1)] = entry.path
+        self.sites = SiteMap(runner, site_paths)
 
-    @property
+    @cached_property
     def defined_projects(self):
         """Get a list of all the projects defined in the config."""
         return frozenset(self.projects.keys())
 
     @property
     def installed_projects(self):
-        """Get a set of all the installed projects."""
+        """Get a set of all the installed projects (directories in the projects folder)."""
         o = self.runner.options
-        return frozenset(os.listdir(os.path.join(o.install_dir, o.projects_dir)))
+        with os.scandir(o.projects_path) as entries:
+            return frozenset(e.name for e in entries if e.is_dir(follow_symlinks=False))
 
-    @property
+    @cached_property
     def used_projects(self):
-        """Generate a set of all the projects used in this tree."""
+        """Generate a set of all the projects used in this tree.
+
+        The result is cached since the config doesn’t change during a run.
+        """
         used_projects = set()
         for s in self.sites.values():
             used_projects.update(s.projects())
         used_projects.add(self.config["core"]["project"])
-        return used_projects
+        return frozenset(used_projects)
+
+
+class SiteMap(collections.abc.Mapping):
+    """Map site names to sites, reading each site’s config only when it’s first needed."""
+
+    def __init__(self, runner, paths):
+        """Create a new map from a dict of site names and config file paths."""
+        self.runner = runner
+        self.paths = paths
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        """Get a site, reading its config if needed."""
+        with self.lock:
+            if name not in self.loaded:
+                self.loaded[name] = Site(self.runner, name, self.paths[name])
+            return self.loaded[name]
+
+    def __iter__(self):
+        """Iterate over all site names."""
+        return iter(self.paths)
+
+    def __len__(self):
+        """Count the sites."""
+        return len(self.paths)
 
 
 class Site(Config):
@@ -162,27 +248,30 @@ class Site(Config):
 
     def project_from_symlink_path(self, path):
         """Calculate the project name from the referenced path."""
-        project = path
         # The symlink might point to a sub-directory of the project.
-        if "/" in project:
-            project = project[: project.find("/")]
-        return project
+        return path.partition("/")[0]
 
     def projects(self):
-        """Iterate through all the referenced projects."""
-        queue = [self.config["links"]]
+        """Iterate through all the referenced projects, yielding each one only once."""
+        seen = set()
+        queue = collections.deque([self.config["links"]])
         while queue:
-            d = queue.pop(0)
+            d = queue.popleft()
             for project_or_dir in d.values():
                 if isinstance(project_or_dir, dict):
                     queue.append(project_or_dir)
-                else:
-                    yield self.project_from_symlink_path(project_or_dir)
+                    continue
+                project = self.project_from_symlink_path(project_or_dir)
+                if project not in seen:
+                    seen.add(project)
+                    yield project
 
         profile = self.profile()
         if profile:
             path = self.runner.config.config["core"]["profiles"][profile]
-            yield self.project_from_symlink_path(path)
+            project = self.project_from_symlink_path(path)
+            if project not in seen:
+                yield project
 
     def profile(self):
         """Return the name of the custom profile used for this site (if any)."""
@@ -195,15 +284,42 @@ class Site(Config):
 class TypedFactory:
     """Factory for config based objects."""
 
-    # pylint: disable=too-few-public-methods
+    def __init__(self, runner, name, types, cache_types=False):
+        """Create a new factory instance.
 
-    def __init__(self, runner, name, types):
-        """Create a new factory instance."""
+        With cache_types the type chosen for each hashable config is remembered, so that configs
+        which are used repeatedly (ie. includes) only run through the list of types once. Objects
+        keep per-config state (eg. the local path of a download) so they are never shared.
+        """
         self.runner, self.name, self.types = runner, name, types
+        self.cached_types = {} if cache_types else None
 
     def produce(self, config):
         """Instantiate the object matching the passed config."""
+        key = self.cache_key(config)
+        if key is not None and key in self.cached_types:
+            return self.cached_types[key](self.runner, config)
+        obj = self.probe(config)
+        if key is not None:
+            self.cached_types[key] = type(obj)
+        return obj
+
+    def cache_key(self, config):
+        """Get the key to cache the type for this config under, if any."""
+        if self.cached_types is None:
+            return None
+        try:
+            return frozenset(config.items())
+        except TypeError:
+            # Configs containing lists or dicts can’t be used as cache keys.
+            return None
+
+    def probe(self, config):
+        """Instantiate the first type that accepts the passed config."""
         for type_ in self.types:
+            # Skip constructing objects for obviously non-applicable configs.
+            if not type_.accepts(config):
+                continue
             try:
                 obj = type_(self.runner, config)
                 if obj.is_valid():
@@ -211,7 +327,7 @@ class TypedFactory:
             except ValueError as exc:
                 # Implementations can err out of non-applicable configs.
                 if self.runner.options.verbose:
-                    print(f"Not a {type.__name__}: {exc}")
+                    print(f"Not a {type_.__name__}: {exc}")
         # pylint: disable=broad-exception-raised
         raise Exception(f"No matching {self.name} for input: {config}")
 
@@ -222,11 +338,16 @@ class Downloader(abc.ABC):
     def __init__(self, runner, config):
         """Create a new downloader."""
         self.runner = runner
-        self.url = config["url"]
-        self.hash = None
-        if self.url.find("#") != -1:
-            self.url, self.hash = self.url.split("#", 1)
-        self.scheme = urllib.parse.urlparse(self.url).scheme
+        # The (optional) URL fragment is the expected sha1 hash of the file.
+        self.url, _, fragment = config["url"].partition("#")
+        self.hash = fragment or None
+        scheme, sep, _ = self.url.partition("://")
+        self.scheme = scheme.lower() if sep else ""
+
+    @classmethod
+    def accepts(cls, _config):
+        """Cheaply check whether a config might be handled by this type of downloader."""
+        return True
 
     def download(self, _rel_to, _store):
         """Fetch the ressource if needed."""
@@ -254,14 +375,12 @@ class ScmNoopDownloader(Downloader):
 
     def __init__(self, runner, config):
         """Create a new SCM downloader."""
-        has_scm_type = "type" in config and config["type"] in ["git"]
-        has_revision_or_branch = "revision" in config or "branch" in config
-        if not has_scm_type and not has_revision_or_branch:
+        if not self.accepts(config):
             raise ValueError("This is not a SCM ressource")
         Downloader.__init__(self, runner, config)
         self.scm_type = "git"
-        self.branch = config["branch"] if "branch" in config else False
-        self.revision = config["revision"] if "revision" in config else False
+        self.branch = config.get("branch", False)
+        self.revision = config.get("revision", False)
 
     def convert_to_make(self, pfx, patch_short_hand=False):
         """Print the drush makefile definitions representing this downloader."""
@@ -272,6 +391,13 @@ class ScmNoopDownloader(Downloader):
         if self.revision:
             print(pfx + "[revision] = " + self.revision)
 
+    @classmethod
+    def accepts(cls, config):
+        """Check whether the config declares a SCM repository."""
+        has_scm_type = config.get("type") == "git"
+        has_revision_or_branch = "revision" in config or "branch" in config
+        return has_scm_type or has_revision_or_branch
+
 
 class LocalDownloader(Downloader):
     """Represent a local file using the Downloader interface."""
@@ -298,31 +424,82 @@ class LocalDownloader(Downloader):
         return not self.scheme
 
 
+class DownloadManifest(utils.JsonStore):
+    """Remember the hashes of downloaded files across runs.
+
+    Entries are only trusted as long as the size and mtime of the file haven’t changed.
+    """
+
+    def get_hash(self, path):
+        """Get the recorded hash of a file unless the file was modified since."""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        entry = self.get(os.path.basename(path))
+        if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["sha1"]
+        return None
+
+    def record(self, path, sha1):
+        """Record the hash of a file."""
+        st = os.stat(path)
+        self.set(
+            os.path.basename(path), {"mtime": st.st_mtime_ns, "size": st.st_size, "sha1": sha1}
+        )
+
+
 class UrllibDownloader(Downloader):
     """Download a file from a remote URL."""
 
+    chunk_size = 1 << 20
+    timeout = 30
+
     def __init__(self, runner, config):
         """Create a new downloader."""
         super().__init__(runner, config)
         self.path = None
+        self.digest = None
 
     def download(self, _rel_to, store):
         """Download the file from the remote URL."""
-        # pylint: disable=broad-exception-raised
         filename = self.url.replace("/", "-").replace(":", "-")
         self.path = os.path.join(store, filename)
+        # Projects built in parallel might reference the same file.
+        with utils.path_lock(self.path):
+            return self.download_to_path()
+
+    def download_to_path(self):
+        """Download the file unless a file with the right hash is there already."""
+        # pylint: disable=broad-exception-raised,import-outside-toplevel
+        # urllib.request is only imported when needed since it’s slow to import.
+        import urllib.request
+
         if os.path.exists(self.path):
             if not self.hash or self.get_hash() == self.hash:
                 return self
             os.unlink(self.path)
         if self.runner.options.verbose:
             print(f"Downloading {self.url}")
+        sha1 = hashlib.sha1()
+        # Stream into a temporary file so that failed downloads don’t leave a partial file behind.
+        tmp = self.path + ".part"
         try:
-            with open(self.path, "wb") as target, urllib.request.urlopen(self.url) as f:
-                target.write(f.read())
+            with open(tmp, "wb") as target, urllib.request.urlopen(
+                self.url, timeout=self.timeout
+            ) as f:
+                while chunk := f.read(self.chunk_size):
+                    target.write(chunk)
+                    sha1.update(chunk)
+            os.replace(tmp, self.path)
         except urllib.error.HTTPError as exc:
             msg = "Error during download of {}: {}"
             raise Exception(msg.format(self.url, str(exc))) from exc
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        self.digest = sha1.hexdigest()
+        self.runner.state.download_manifest.record(self.path, self.digest)
         if self.hash:
             actual_hash = self.get_hash()
             if self.hash != actual_hash:
@@ -332,8 +509,18 @@ class UrllibDownloader(Downloader):
 
     def get_hash(self):
         """Calculate the hash of the downloaded file."""
-        with open(self.path, "rb") as f:
-            return hashlib.sha1(f.read()).hexdigest()
+        if self.digest:
+            return self.digest
+        manifest = self.runner.state.download_manifest
+        self.digest = manifest.get_hash(self.path)
+        if not self.digest:
+            sha1 = hashlib.sha1()
+            with open(self.path, "rb") as f:
+                while chunk := f.read(self.chunk_size):
+                    sha1.update(chunk)
+            self.digest = sha1.hexdigest()
+            manifest.record(self.path, self.digest)
+        return self.digest
 
     def localpath(self):
         """Get the local path of the downloaded file."""
@@ -349,18 +536,25 @@ class Ressource:
     """Downloadable resource."""
 
     def __init__(self, runner, config):
-        """Create a new resource."""
+        """Create a new resource.
+
+        Only top-level keys of the config are ever changed so a shallow copy is sufficient.
+        """
         self.runner = runner
-        self.config = deepcopy(config)
-        if isinstance(self.config, str):
-            self.config = {"url": config}
+        self.config = {"url": config} if isinstance(config, str) else dict(config)
         add_defaults(self.config, {"devel": None})
 
+    @cached_property
+    def downloader(self):
+        """Get the downloader for this ressource."""
+        return self.runner.get_downloader(self.config)
+
     def download(self):
         """Download the ressource into the download folder."""
         o = self.runner.options
-        downloader = self.runner.get_downloader(self.config)
-        downloader.download(o.source_dir, o.download_dir)
+        downloader = self.downloader
+        with self.runner.state.host_semaphore(downloader.url):
+            downloader.download(o.source_dir, o.download_dir)
         self.config["localpath"] = downloader.localpath()
 
     def apply_to(self, target):
@@ -374,13 +568,14 @@ class Ressource:
 
     def convert_to_make(self, pfx, patch_short_hand=False):
         """Print the drush makefile definitions representing this ressource."""
-        if "purpose" in self.config:
-            comment = "; " + self.config["purpose"]
-            if "link" in self.config:
-                comment += " - " + self.config["link"]
+        purpose = self.config.get("purpose")
+        if purpose is not None:
+            comment = "; " + purpose
+            link = self.config.get("link")
+            if link is not None:
+                comment += " - " + link
             print(comment)
-        downloader = self.runner.get_downloader(self.config)
-        downloader.convert_to_make(pfx, patch_short_hand)
+        self.downloader.convert_to_make(pfx, patch_short_hand)
 
 
 class Applier(abc.ABC):
@@ -390,9 +585,14 @@ class Applier(abc.ABC):
         """Set the default properties."""
         self.runner = runner
         self.path = config["localpath"]
-        self.type = config["type"] if "type" in config else None
+        self.type = config.get("type")
         self.config = config
 
+    @classmethod
+    def accepts(cls, _config):
+        """Cheaply check whether a config might be handled by this type of applier."""
+        return True
+
     @abc.abstractmethod
     def apply_to(self, target):
         """Apply the actions to the target directory."""
@@ -405,59 +605,41 @@ class Applier(abc.ABC):
 class TarballExtract(Applier):
     """Extract a tarball."""
 
-    exts = [".tar.gz", ".tgz", ".tar.bz2", "tbz2", ".tar.xz", ".tar", ".zip"]
+    exts = (".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".tar", ".zip")
 
     def apply_to(self, target):
         """Apply the changes to the target directory."""
-        unpack = setuptools.archive_util.unpack_archive
+        archives.extract(self.path, target, self.config.get("exclude", []))
+        utils.normalize_permissions(target, self.runner.options.umask)
 
-        # Dry run to find longest prefix.
-        paths = []
-
-        def record_paths(name, _):
-            paths.append(name)
-            return False
-
-        unpack(self.path, target, progress_filter=record_paths)
-        prefix = len(os.path.commonprefix(paths))
-        exclude_patterns = [re.compile(p) for p in self.config.get("exclude", [])]
-
-        # Actuall unpacking.
-        def extract_filter(name, _):
-            if len(name) <= prefix:
-                return False
-            name = name[prefix:]
-            if name.startswith("/"):
-                name = name[1:]
-            if any(p.search(name) for p in exclude_patterns):
-                return False
-            return target + "/" + name
-
-        unpack(self.path, target, progress_filter=extract_filter)
-        utils.normalize_permissions(target)
+    @classmethod
+    def accepts(cls, config):
+        """Check whether the config declares or looks like an archive."""
+        return config.get("type") == "tarball" or config["localpath"].endswith(cls.exts)
 
     def is_valid(self):
         """Check if the config is valid for this type of applier."""
-        if self.type == "tarball":
-            return True
-        for ext in self.exts:
-            if self.path.endswith(ext):
-                return True
-        return False
+        return self.accepts(self.config)
 
 
 class PatchApplier(Applier):
     """Apply a patch."""
 
+    exts = (".patch", ".diff")
+
     def apply_to(self, target):
         """Apply the changes to the target directory."""
-        cmd = "patch --no-backup-if-mismatch -p1 -d {} < {}"
-        self.runner.command(cmd.format(target, self.path), shell=True)
+        cmd = ["patch", "--no-backup-if-mismatch", "-p1", "-d", target, "-i", self.path]
+        self.runner.command(cmd)
+
+    @classmethod
+    def accepts(cls, config):
+        """Check whether the config declares or looks like a patch."""
+        return config.get("type") == "patch" or config["localpath"].endswith(cls.exts)
 
     def is_valid(self):
         """Check if the config is valid for this type of applier."""
-        p = self.path
-        return p.endswith(".patch") or p.endswith(".diff") or self.type == "patch"
+        return self.accepts(self.config)
 
 
 class CopyFileApplier(Applier):
@@ -486,39 +668,44 @@ class GitRepoApplier(Applier):
         Applier.__init__(self, runner, config)
         self.url = config["url"]
         self.shallow = config.get("shallow", True)
+        self.branch = config.get("branch")
+        self.revision = config.get("revision")
 
     def apply_to(self, target):
         """Apply the changes to the target directory."""
         call = ["git", "clone", self.url]
 
-        if "branch" in self.config:
-            call += ["-b", self.config["branch"]]
+        if self.branch:
+            call += ["-b", self.branch]
 
-        has_revision = "revision" in self.config and self.config["revision"]
-        if self.shallow and not has_revision:
+        if self.revision:
+            # Don’t write a working tree that is replaced by the checkout below anyway.
+            call.append("--no-checkout")
+        elif self.shallow:
             call += ["--depth", "1"]
 
         call.append(target)
         self.runner.command(call)
 
-        if has_revision:
-            wd = os.getcwd()
-            os.chdir(target)
-            self.runner.command(["git", "checkout", self.config["revision"]])
-            os.chdir(wd)
+        if self.revision:
+            self.runner.command(["git", "checkout", self.revision], cwd=target)
+
+    @classmethod
+    def accepts(cls, config):
+        """Check whether the config declares a git repository."""
+        return config.get("type") == "git" or "branch" in config or "revision" in config
 
     def is_valid(self):
         """Check if the config is valid for this type of applier."""
-        return self.type == "git" or "branch" in self.config or "revision" in self.config
+        return self.accepts(self.config)
 
 
 class DirectoryApplier(Applier):
     """Copy the content of one directory into the target directory."""
 
     def apply_to(self, target):
-        """Apply the changes to the target directory."""
-        self.runner.ensure_dir(target)
-        self.runner.command(["rsync", "-rlt", self.path + "/", target + "/"])
+        """Copy the directory like `rsync -rlt` would."""
+        utils.copy_tree(self.path, target, self.runner.options.umask)
 
     def is_valid(self):
         """Check if the project config is valid for its type."""
@@ -541,12 +728,16 @@ class Project:
         )
         self.runner = runner
         self.config = config
-        self.hash = self.hash_dict(self.config)
         self.dirname = config["dirname"]
-        self.pipeline = deepcopy(config["build"])
+        self.pipeline = list(config["build"])
         self.type = config["type"]
         self.protected = config["protected"]
 
+    @classmethod
+    def accepts(cls, _config):
+        """Cheaply check whether a config might be handled by this type of project."""
+        return True
+
     def is_valid(self):
         """Check if the project config is valid for its type."""
         return True
@@ -554,11 +745,26 @@ class Project:
     def build(self, target):
         """Download and extract the project."""
         self.runner.ensure_dir(target)
-        for config in self.pipeline:
-            ressource = Ressource(self.runner, config)
-            ressource.download()
+        ressources = [Ressource(self.runner, config) for config in self.pipeline]
+        if len(ressources) == 1:
+            ressources[0].download()
+            ressources[0].apply_to(target)
+            return
+        # Download all ressources concurrently but apply them in pipeline order.
+        downloads = [self.runner.state.download_pool.submit(r.download) for r in ressources]
+        for ressource, download in zip(ressources, downloads):
+            download.result()
             ressource.apply_to(target)
 
+    @cached_property
+    def hash(self):
+        """Get the hash of this project’s configuration.
+
+        The hash is only needed when the project is actually built or checked for updates so it’s
+        calculated lazily.
+        """
+        return self.hash_dict(self.config)
+
     def hash_dict(self, the_dict):
         """Generate a unique hash for this project configuration."""
         json_dump = json.dumps(the_dict, sort_keys=True)
@@ -581,7 +787,7 @@ class DrupalOrgProject(Project):
     """Project representing a project published on drupal.org."""
 
     package_pattern = re.compile(
-        "([a-z0-9_]+)-(\\d+\\.x)-(\\d+\\.x-dev|\\d+\\.\\d+(-(alpha|beta|rc)\\d+)?)"
+        r"([a-z0-9_]+)-(\d+\.x)-(\d+\.x-dev|\d+\.\d+(?:-(?:alpha|beta|rc)\d+)?)"
     )
     url_pattern = "https://ftp.drupal.org/files/projects/{}-{}-{}.tar.gz"
 
@@ -600,8 +806,9 @@ class DrupalOrgProject(Project):
             # another non-patch build item in the pipeline.
             if not self.pipeline or self.is_patch(self.pipeline[0]):
                 build = {"url": self.url_pattern.format(self.project, self.core, self.version)}
-                if "hash" in self.config:
-                    build["hash"] = self.config["hash"]
+                hash_ = self.config.get("hash")
+                if hash_ is not None:
+                    build["hash"] = hash_
                 self.pipeline.insert(0, build)
             if self.type is None:
                 self.type = "drupal.org"
@@ -610,11 +817,18 @@ class DrupalOrgProject(Project):
 
     def is_patch(self, config):
         """Check whether pipeline items resolves to a patch."""
-        ressource = Ressource(self.runner, config)
-        u = ressource.config["url"]
-        return (
-            u.endswith(".diff") or u.endswith(".patch") or ressource.config.get("type") == "patch"
-        )
+        if isinstance(config, str):
+            return config.endswith(PatchApplier.exts)
+        return config.get("type") == "patch" or config["url"].endswith(PatchApplier.exts)
+
+    @classmethod
+    def accepts(cls, config):
+        """Check whether the config declares or looks like a drupal.org project."""
+        type_ = config.get("type")
+        if type_ is None:
+            name = config["dirname"].split("+", 1)[0]
+            return cls.package_pattern.fullmatch(name) is not None
+        return type_ == "drupal.org"
 
     @classmethod
     def split_project(cls, name):
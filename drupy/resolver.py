@@ -1,69 +1,139 @@
 """Implement a dependency resolver for build targets."""
 
+import collections
+import heapq
+import itertools
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import cached_property
+
+from . import utils
+
+
+class Timings(utils.JsonStore):
+    """Remember how long each target took to build in previous runs."""
+
+    def get(self, key, default=1.0):
+        """Get the recorded build time of a target in seconds."""
+        return super().get(key, default)
+
+    def record(self, tid, seconds):
+        """Record the build time of a target."""
+        self.set(tid, seconds)
+
 
 class Resolver:
-    """Dependency resolver for build targets."""
+    """Dependency resolver for build targets.
+
+    Targets that are ready to be built are executed in order of their priority: The estimated time
+    it takes to build the target and all targets that (transitively) depend on it. This makes sure
+    that targets on the critical path are started first.
+
+    Targets are tracked by identity: Target.get() makes sure that there is only one target object
+    for each set of arguments.
+    """
 
-    def __init__(self, options):
+    def __init__(self, options, timings=None):
         """Create a new resolver."""
         self.options = options
+        self.timings = timings
         self.ready_queue = []
         self.dependent = {}
         self.dependencies = {}
+        self.priorities = {}
+        self.counter = itertools.count()
 
     def resolve(self, targets):
         """Create a sequence of targets to build in order to reach the passed-in targets."""
-        while len(targets) > 0:
-            target = targets.pop(0)
-            tid = repr(target)
-            if tid in self.dependencies:
+        targets = collections.deque(targets)
+        ready = []
+        while targets:
+            target = targets.popleft()
+            if target in self.dependencies:
                 continue
-            deps = target.dependencies()
+            deps = target.deps
             ndeps = len(deps)
-            self.dependencies[tid] = ndeps
+            self.dependencies[target] = ndeps
             if ndeps > 0:
                 for dep in deps:
-                    dep_tid = repr(dep)
-                    if dep_tid not in self.dependent:
-                        self.dependent[dep_tid] = []
-                    self.dependent[dep_tid].append(target)
+                    self.dependent.setdefault(dep, []).append(target)
                     targets.append(dep)
             else:
-                self.ready_queue.append(target)
+                ready.append(target)
+        self.priorities = {}
+        for target in ready:
+            self.push_ready(target)
         if self.options.debug:
             print(self.ready_queue)
             print(self.dependent)
             print(self.dependencies)
 
-    def execute(self):
-        """Build all targets."""
-        while self.ready_queue:
-            target = self.ready_queue.pop(0)
-            tid = repr(target)
-
-            needs_build = (
-                not target.already_built()
-                or self.options.rebuild
-                or (self.options.update and target.updateable())
+    def weight(self, target):
+        """Get the estimated build time of a single target."""
+        return self.timings.get(repr(target)) if self.timings else 1.0
+
+    def priority(self, target):
+        """Get the length of the longest weighted path from the target to any final target."""
+        if target not in self.priorities:
+            dependents = self.dependent.get(target, ())
+            self.priorities[target] = self.weight(target) + max(
+                (self.priority(dep) for dep in dependents), default=0
             )
-            if needs_build:
-                if self.options.verbose:
-                    print("Executing: " + tid)
-                if not self.options.dry_run:
-                    target.build()
-            else:
-                if self.options.verbose:
-                    print("Skipping: " + tid)
+        return self.priorities[target]
 
-            del self.dependencies[tid]
-            if tid not in self.dependent:
-                continue
-            for dep in self.dependent[tid]:
-                dep_tid = repr(dep)
-                self.dependencies[dep_tid] -= 1
-                if self.dependencies[dep_tid] == 0:
-                    self.ready_queue.append(dep)
-            del self.dependent[tid]
+    def push_ready(self, target):
+        """Add a target to the ready queue."""
+        entry = (-self.priority(target), next(self.counter), target)
+        heapq.heappush(self.ready_queue, entry)
+
+    def execute(self):
+        """Build all targets.
+
+        Targets whose dependencies are all built are independent of each other and are built
+        concurrently using up to options.jobs threads.
+        """
+        jobs = max(self.options.jobs, 1)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            running = {}
+            while self.ready_queue or running:
+                # Only submit as many targets as can run so that later ready targets with a higher
+                # priority don’t have to queue up behind them.
+                while self.ready_queue and len(running) < jobs:
+                    target = heapq.heappop(self.ready_queue)[-1]
+                    running[pool.submit(self.execute_target, target)] = target
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    target = running.pop(future)
+                    future.result()
+                    self.mark_done(target)
+
+    def execute_target(self, target):
+        """Build a single target if needed."""
+        tid = repr(target)
+        needs_build = (
+            not target.already_built()
+            or self.options.rebuild
+            or (self.options.update and target.updateable())
+        )
+        if needs_build:
+            if self.options.verbose:
+                print("Executing: " + tid)
+            if not self.options.dry_run:
+                start = time.monotonic()
+                target.build()
+                if self.timings is not None:
+                    self.timings.record(tid, time.monotonic() - start)
+        else:
+            if self.options.verbose:
+                print("Skipping: " + tid)
+
+    def mark_done(self, target):
+        """Queue all dependent targets that have no other unbuilt dependencies."""
+        del self.dependencies[target]
+        for dep in self.dependent.pop(target, ()):
+            self.dependencies[dep] -= 1
+            if self.dependencies[dep] == 0:
+                self.push_ready(dep)
 
 
 class Target:
@@ -76,10 +146,24 @@ class Target:
         self.runner = runner
         self.options = self.runner.options
 
+    @classmethod
+    def get(cls, runner, *args):
+        """Get the target for these arguments, constructing it only once per runner."""
+        key = (cls, *args)
+        targets = runner.state.targets
+        if key not in targets:
+            targets[key] = cls(runner, *args)
+        return targets[key]
+
     def dependencies(self):
         """Get the dependencies of this target."""
         return []
 
+    @cached_property
+    def deps(self):
+        """Get the dependencies of this target, computing them only once."""
+        return tuple(self.dependencies())
+
     def already_built(self):
         """Check if the target has been built already."""
         return False
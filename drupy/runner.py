@@ -1,15 +1,21 @@
 """CLI handling and top-level execution."""
 
+import atexit
+import collections
 import os
 import os.path
 import shlex
 import shutil
 import subprocess
 import sys
+import threading
+import urllib.parse
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from glob import glob
 
-from . import objects, resolver
+from . import objects, resolver, utils
 from .targets import DBInstallTarget, ResetCacheTarget, SiteBuildTarget, SiteInstallTarget
 
 
@@ -110,6 +116,14 @@ class CommandParser(ArgumentParser):
             action="store_true",
             help="Show the list of targets that will be built and exit.",
         )
+        actions_group.add_argument(
+            "-j",
+            "--jobs",
+            dest="jobs",
+            type=int,
+            default=1,
+            help="Number of independent targets to build in parallel. (default: 1)",
+        )
         actions_group.add_argument(
             "--opcache-reset-url",
             dest="opcache_reset_url",
@@ -210,9 +224,53 @@ class CommandParser(ArgumentParser):
                 path = os.path.abspath(options.overrides_dir) + "/" + path
             mapping[parts[0]] = path
         options.overrides = mapping
+
+        # Read the umask while there is only one thread (see utils.get_umask()).
+        options.umask = utils.get_umask()
         return options
 
 
+class RunState:
+    """State of a single run that is shared between targets and worker threads."""
+
+    def __init__(self, options):
+        """Create the thread pools and load the download manifest."""
+        self.download_pool = ThreadPoolExecutor(max_workers=8)
+        self.cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="drupy-rm")
+        self.host_semaphores = collections.defaultdict(lambda: threading.Semaphore(4))
+        self.lock = threading.Lock()
+        self.ensured_dirs = set()
+        self.targets = {}
+        self.download_manifest = objects.DownloadManifest(
+            os.path.join(options.download_dir, ".dbuild-cache.json")
+        )
+        atexit.register(self.download_manifest.save)
+
+    def host_semaphore(self, url):
+        """Get the semaphore limiting concurrent downloads from the URL’s host."""
+        with self.lock:
+            return self.host_semaphores[urllib.parse.urlparse(url).netloc]
+
+    def remove_tree(self, path):
+        """Delete a directory tree in the background."""
+        future = self.cleanup_pool.submit(shutil.rmtree, path)
+        future.add_done_callback(partial(self.report_cleanup, path))
+
+    @staticmethod
+    def report_cleanup(path, future):
+        """Report a failed background deletion."""
+        try:
+            future.result()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Failed to delete: {path}: {e}")
+
+    def wait_for_cleanups(self):
+        """Wait until all background deletions are done."""
+        self.cleanup_pool.shutdown(wait=True)
+
+
 class Runner:
     """Coordinate the execution of tasks."""
 
@@ -235,6 +293,7 @@ class Runner:
                 objects.UrllibDownloader,
                 objects.LocalDownloader,
             ],
+            cache_types=True,
         )
         self.applier_factory = objects.TypedFactory(
             self,
@@ -255,8 +314,8 @@ class Runner:
                 objects.Project,
             ],
         )
-        self.core_config = None
         self.config = None
+        self.state = RunState(self.options)
 
     def get_downloader(self, config):
         """Create a downloader from a config dict."""
@@ -271,14 +330,21 @@ class Runner:
         return self.project_factory.produce(config)
 
     def ensure_dir(self, d):
-        """Create a directory and all its parents."""
-        if not os.path.exists(d):
-            os.makedirs(d)
+        """Create a directory and all its parents.
+
+        Directories that were ensured once during this run are assumed to still exist.
+        """
+        if d in self.state.ensured_dirs:
+            return
+        os.makedirs(d, exist_ok=True)
+        self.state.ensured_dirs.add(d)
 
     def rsync_dirs(self, source, target, excludes=None, only_non_existing=False):
         """Update the contents of the target directory based on the source directory."""
         self.ensure_dir(target)
-        cmd = ["rsync", "-rlt", "--delete", "--progress", source + "/", target + "/"]
+        cmd = ["rsync", "-rlt", "--delete", source + "/", target + "/"]
+        if self.options.verbose:
+            cmd.append("--progress")
         if only_non_existing:
             cmd.append("--ignore-existing")
         cmd += ["--exclude=" + x for x in (excludes or [])]
@@ -286,10 +352,10 @@ class Runner:
 
     def project_symlinks(self, path, elements, depth=0):
         """Create a directory structure containing symlinks based on a dict."""
-        dirqueue = [(path, depth, elements)]
+        dirqueue = collections.deque([(path, depth, elements)])
         projects = self.options.projects_dir
-        while len(dirqueue) > 0:
-            path, depth, element = dirqueue.pop(0)
+        while dirqueue:
+            path, depth, element = dirqueue.popleft()
             if isinstance(element, str):
                 if os.path.lexists(path):
                     os.unlink(path)
@@ -311,16 +377,16 @@ class Runner:
         cmd = shlex.split(self.options.drush)
         self.command(cmd + arguments, shell=False)
 
-    def command(self, cmd, shell=False):
+    def command(self, cmd, shell=False, cwd=None):
         """Execute a (shell) command."""
         if self.options.verbose:
-            print(f"{os.getcwd()} > {cmd} ({shell})")
+            print(f"{cwd or os.getcwd()} > {cmd} ({shell})")
         if self.options.debug:
             subprocess.check_call(
-                cmd, shell=shell, env=os.environ, stderr=sys.stderr, stdout=sys.stdout
+                cmd, shell=shell, cwd=cwd, env=os.environ, stderr=sys.stderr, stdout=sys.stdout
             )
         else:
-            subprocess.check_call(cmd, shell=shell, env=os.environ)
+            subprocess.check_call(cmd, shell=shell, cwd=cwd, env=os.environ)
 
     def parse_config(self):
         """Read config from a file."""
@@ -330,33 +396,43 @@ class Runner:
         o.document_root = self.config.config["documentRoot"]
         o.core_config = self.config.config["core"]
         o.projects_dir = self.config.config["projectsDir"]
+        o.projects_path = os.path.join(o.install_dir, o.projects_dir)
 
     def run(self):
         """Execute all actions to build the target."""
         self.parse_config()
-        self.commands[self.options.target]()
+        try:
+            self.commands[self.options.target]()
+        finally:
+            self.state.wait_for_cleanups()
+
+    def create_resolver(self):
+        """Create a resolver that uses the build times recorded in previous runs."""
+        timings = resolver.Timings(os.path.join(self.options.download_dir, ".dbuild-timings.json"))
+        atexit.register(timings.save)
+        return resolver.Resolver(self.options, timings)
 
     def run_build(self):
         """Build all projects for the specified sites."""
-        t = [SiteBuildTarget(self, s) for s in self.options.sites]
-        r = resolver.Resolver(self.options)
+        t = [SiteBuildTarget.get(self, s) for s in self.options.sites]
+        r = self.create_resolver()
         r.resolve(t)
         r.execute()
 
     def run_install(self):
         """Build and install all specified sites."""
-        r = resolver.Resolver(self.options)
+        r = self.create_resolver()
         r.resolve(
-            [SiteInstallTarget(self, s) for s in self.options.sites]
+            [SiteInstallTarget.get(self, s) for s in self.options.sites]
             + [ResetCacheTarget(self, self.options.sites)]
         )
         r.execute()
 
     def run_db_install(self):
         """Build, install and db-install all specified sites."""
-        r = resolver.Resolver(self.options)
+        r = self.create_resolver()
         r.resolve(
-            [DBInstallTarget(self, s) for s in self.options.sites]
+            [DBInstallTarget.get(self, s) for s in self.options.sites]
             + [ResetCacheTarget(self, self.options.sites)]
         )
         r.execute()
@@ -408,7 +484,7 @@ class Runner:
         if obsolete_projects:
             print("Deleting obsolete projects …")
             for p in sorted(obsolete_projects):
-                shutil.rmtree(os.path.join(o.install_dir, o.projects_dir, p))
+                shutil.rmtree(os.path.join(o.projects_path, p))
                 print(f"\t{p} deleted.")
 
 
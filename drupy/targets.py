@@ -2,12 +2,19 @@
 
 import os
 import os.path
-import shutil
-import urllib
 
 from . import resolver
 
 
+def read_hash(path):
+    """Read a .dbuild-hash file or return None if it doesn’t exist."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
 class DirsTarget(resolver.Target):
     """Ensure that a directory exists."""
 
@@ -15,7 +22,7 @@ class DirsTarget(resolver.Target):
         """Create the directory if needed."""
         o = self.options
         self.runner.ensure_dir(o.download_dir)
-        self.runner.ensure_dir(os.path.join(o.install_dir, o.projects_dir))
+        self.runner.ensure_dir(o.projects_path)
 
 
 class BuildProjectTarget(resolver.Target):
@@ -27,17 +34,19 @@ class BuildProjectTarget(resolver.Target):
         o = self.runner.options
         self.name = project
         self.project = self.runner.config.projects[project]
-        self.target = os.path.join(o.install_dir, o.projects_dir, project)
+        self.target = os.path.join(o.projects_path, project)
+        self.delete = self.target + ".delete"
+        self.hash_file = os.path.join(self.target, ".dbuild-hash")
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        return [DirsTarget(self.runner)]
+        return [DirsTarget.get(self.runner)]
 
     def build(self):
         """Download and extract the projects files."""
         target = self.target
+        delete = self.delete
         tmp = target + "." + self.project.hash
-        delete = target + ".delete"
 
         try:
             self.project.build(tmp)
@@ -45,17 +54,19 @@ class BuildProjectTarget(resolver.Target):
             with open(tmp + "/.dbuild-hash", "w", encoding="utf-8") as f:
                 f.write(self.project.hash)
 
-            if os.path.exists(target):
+            try:
                 os.rename(target, delete)
+            except FileNotFoundError:
+                pass
             os.rename(tmp, target)
-            if os.path.exists(delete):
-                try:
-                    shutil.rmtree(delete)
-                except os.OSError as e:
-                    print("Failed to delete: " + delete + ": " + str(e))
-        finally:
-            if os.path.exists(tmp) and not self.options.debug:
-                shutil.rmtree(tmp)
+        except BaseException:
+            # A missing tmp directory is ignored by the background cleanup.
+            if not self.options.debug:
+                self.runner.state.remove_tree(tmp)
+            raise
+        # Keep the old build until the new one is in place so that it can be recovered if renaming
+        # fails. A missing directory is ignored by the background cleanup.
+        self.runner.state.remove_tree(delete)
 
     def already_built(self):
         """Check if the project has already been built."""
@@ -65,11 +76,9 @@ class BuildProjectTarget(resolver.Target):
         """Check if the project definition’s hash has changed since the last build."""
         if self.project.protected:
             return False
-        hashfile = self.target + "/.dbuild-hash"
-        if not os.path.exists(hashfile):
+        old_hash = read_hash(self.hash_file)
+        if old_hash is None:
             return True
-        with open(hashfile, "r", encoding="utf-8") as f:
-            old_hash = f.read()
         if self.options.verbose and old_hash != self.project.hash:
             msg = "Hashes don't match: {} != {}"
             print(msg.format(self.project.hash, old_hash))
@@ -83,17 +92,15 @@ class BuildProjectTarget(resolver.Target):
 class DBInstallTarget(resolver.SiteTarget):
     """Target that represents drush site-install."""
 
+    def __init__(self, runner, site):
+        """Create a new db install target."""
+        resolver.SiteTarget.__init__(self, runner, site)
+        o = self.options
+        self.settings = os.path.join(o.install_dir, o.document_root, "sites", site, "settings.php")
+
     def already_built(self):
-        """Check if a settings.py was created already."""
-        os.path.exists(
-            os.path.join(
-                self.options.install_dir,
-                self.options.document_root,
-                "sites",
-                self.site,
-                "/settings.php",
-            )
-        )
+        """Check if a settings.php was created already."""
+        return os.path.exists(self.settings)
 
     def updateable(self):
         """Mark this target as always updateable."""
@@ -106,8 +113,8 @@ class DBInstallTarget(resolver.SiteTarget):
 
         db_url = config["db-url"]
         if o.db_prefix is not None:
-            p = db_url.rfind("/") + 1
-            db_url = db_url[:p] + o.db_prefix + db_url[p:]
+            head, sep, tail = db_url.rpartition("/")
+            db_url = head + sep + o.db_prefix + tail
 
         profile = config["profile"]
 
@@ -129,7 +136,7 @@ class DBInstallTarget(resolver.SiteTarget):
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        return [SiteInstallTarget(self.runner, self.site)]
+        return [SiteInstallTarget.get(self.runner, self.site)]
 
 
 class ProfileInstallTarget(resolver.Target):
@@ -148,7 +155,10 @@ class ProfileInstallTarget(resolver.Target):
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        return [CoreInstallTarget(self.runner), BuildProjectTarget(self.runner, self.project)]
+        return [
+            CoreInstallTarget.get(self.runner),
+            BuildProjectTarget.get(self.runner, self.project),
+        ]
 
     def build(self):
         """Create symlinks in the profiles folder."""
@@ -162,15 +172,15 @@ class SiteBuildTarget(resolver.SiteTarget):
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        targets = [CoreBuildTarget(self.runner)]
+        targets = [CoreBuildTarget.get(self.runner)]
 
         if self.site != "all":
-            targets.append(SiteBuildTarget(self.runner, "all"))
+            targets.append(SiteBuildTarget.get(self.runner, "all"))
 
         # Depend on all projects this site links to.
         site = self.runner.config.sites[self.site]
         for project in site.projects():
-            targets.append(BuildProjectTarget(self.runner, project))
+            targets.append(BuildProjectTarget.get(self.runner, project))
 
         return targets
 
@@ -182,6 +192,8 @@ class ResetCacheTarget(resolver.Target):
     opcache clear PHP might keep executing scripts from the old folder.
     """
 
+    timeout = 30
+
     def __init__(self, runner, sites):
         """Create a new reset cache target."""
         super().__init__(runner)
@@ -189,17 +201,20 @@ class ResetCacheTarget(resolver.Target):
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        return [SiteInstallTarget(self.runner, s) for s in self.sites]
+        return [SiteInstallTarget.get(self.runner, s) for s in self.sites]
 
     def build(self):
         """Call the configured opcache reset URL."""
+        # pylint: disable=import-outside-toplevel
+        import urllib.request
+
         o = self.options
         if not o.opcache_reset_key:
             return
         try:
             url = o.opcache_reset_url + o.opcache_reset_key
-            urllib.request.urlopen(url)  # pylint: disable=consider-using-with
-            print("Reset cache called successfully")
+            with urllib.request.urlopen(url, timeout=self.timeout):
+                print("Reset cache called successfully")
         except urllib.error.HTTPError as exc:
             # pylint: disable=broad-exception-raised
             raise Exception(f"Failed to reset cache on {url}: {exc}") from exc
@@ -218,15 +233,15 @@ class SiteInstallTarget(resolver.SiteTarget):
     def dependencies(self):
         """Return dependencies for this build target."""
         targets = [
-            CoreInstallTarget(self.runner),
-            SiteBuildTarget(self.runner, self.site),
+            CoreInstallTarget.get(self.runner),
+            SiteBuildTarget.get(self.runner, self.site),
         ]
         if self.site != "all":
-            targets.append(SiteInstallTarget(self.runner, "all"))
+            targets.append(SiteInstallTarget.get(self.runner, "all"))
 
             profile = self.runner.config.sites[self.site].profile()
             if profile:
-                targets.append(ProfileInstallTarget(self.runner, profile))
+                targets.append(ProfileInstallTarget.get(self.runner, profile))
         return targets
 
     def build(self):
@@ -241,7 +256,7 @@ class CoreBuildTarget(resolver.Target):
     def dependencies(self):
         """Return dependencies for this build target."""
         project = self.runner.config.config["core"]["project"]
-        return [BuildProjectTarget(self.runner, project)]
+        return [BuildProjectTarget.get(self.runner, project)]
 
 
 class CoreInstallTarget(resolver.Target):
@@ -251,10 +266,17 @@ class CoreInstallTarget(resolver.Target):
         """Create the core install target install."""
         resolver.Target.__init__(self, runner)
         o = self.options
-        self.source = os.path.join(o.install_dir, o.projects_dir, o.core_config["project"])
+        self.source = os.path.join(o.projects_path, o.core_config["project"])
         self.target = os.path.join(o.install_dir, o.document_root)
         self.src_hash = os.path.join(self.source, ".dbuild-hash")
         self.tgt_hash = os.path.join(self.target, ".dbuild-hash")
+        protected = o.core_config["protected"]
+        # Sync core but keep sites and profile symlinks.
+        profiles = self.runner.config.config["core"]["profiles"]
+        self.core_excludes = ["sites/*/"] + ["profiles/" + x for x in profiles] + protected
+        self.sites_excludes = ["*/"] + [
+            x[len("sites/") :] for x in protected if x.startswith("sites/") and x != "sites/"
+        ]
 
     def already_built(self):
         """Check if there is already a Drupal tree at the target location."""
@@ -262,31 +284,17 @@ class CoreInstallTarget(resolver.Target):
 
     def updateable(self):
         """Check if the built Drupal tree’s hash differes from the installed one."""
-        with open(self.tgt_hash, encoding="utf-8") as f_tgt:
-            with open(self.src_hash, encoding="utf-8") as f_src:
-                return f_tgt.read() != f_src.read()
+        return read_hash(self.tgt_hash) != read_hash(self.src_hash)
 
     def dependencies(self):
         """Return dependencies for this build target."""
-        return [CoreBuildTarget(self.runner)]
+        return [CoreBuildTarget.get(self.runner)]
 
     def build(self):
         """Copy the built Drupal tree using rsync."""
         rsync = self.runner.rsync_dirs
-        protected = self.options.core_config["protected"]
-        # Sync core but keep sites and profile symlinks.
-        profiles = self.runner.config.config["core"]["profiles"]
-        excludes = ["profiles/" + x for x in profiles]
-        rsync(self.source, self.target, ["sites/*/"] + excludes + protected)
-        protected_in_sites = [
-            x[len("sites/") :]
-            for x in protected
-            if x.startswith("sites/") and len(x) > len("sites/")
-        ]
-        rsync(
-            self.source + "/sites",
-            self.target + "/sites",
-            ["*/"] + protected_in_sites,
-            only_non_existing=True,
-        )
-        rsync(self.source + "/sites/default", self.target + "/sites/default")
+        src_sites = os.path.join(self.source, "sites")
+        tgt_sites = os.path.join(self.target, "sites")
+        rsync(self.source, self.target, self.core_excludes)
+        rsync(src_sites, tgt_sites, self.sites_excludes, only_non_existing=True)
+        rsync(os.path.join(src_sites, "default"), os.path.join(tgt_sites, "default"))
@@ -1,20 +1,30 @@
 """Utility functions."""
 
+import collections
+import json
 import os
 import os.path
+import shutil
+import threading
+
+path_locks = collections.defaultdict(threading.Lock)
+path_locks_guard = threading.Lock()
 
 
 def get_umask():
-    """Read the umask currently set for this process."""
+    """Read the umask currently set for this process.
+
+    This briefly sets the umask to 0, so it must only be called before any worker threads are
+    started: Files created by other threads in the meantime would be world-writable.
+    """
     # The umask can’t be read without writing it so set it and reset it immediately.
     umask = os.umask(0)
     os.umask(umask)
     return umask
 
 
-def normalize_permissions(path):
-    """Recursively set the permissions on files and directories based on the current umask."""
-    umask = get_umask()
+def normalize_permissions(path, umask):
+    """Recursively set the permissions on files and directories based on the umask."""
     dir_perm = 0o777 & ~umask
     file_perm = 0o666 & ~umask
 
@@ -23,3 +33,98 @@ def normalize_permissions(path):
             os.chmod(os.path.join(root, dir_), dir_perm)
         for file in files:
             os.chmod(os.path.join(root, file), file_perm)
+
+
+def copy_tree(src, target, umask):
+    """Copy a directory into the target directory like `rsync -rlt` would.
+
+    Existing files and symlinks in the target are replaced and symlinks are copied as symlinks.
+    Modification times are preserved. Like rsync without -p, new files get the source’s
+    permissions masked by the umask while existing files keep their permissions.
+    """
+    dirs_copied = []
+    for root, dirs, files in os.walk(src):
+        dest_root = os.path.normpath(os.path.join(target, os.path.relpath(root, src)))
+        if os.path.islink(dest_root) or os.path.isfile(dest_root):
+            os.unlink(dest_root)
+        os.makedirs(dest_root, exist_ok=True)
+        dirs_copied.append((root, dest_root))
+        for name in dirs + files:
+            src_path = os.path.join(root, name)
+            dest = os.path.join(dest_root, name)
+            if os.path.islink(src_path):
+                remove_path(dest)
+                os.symlink(os.readlink(src_path), dest)
+            elif name in files:
+                # Don’t write through an existing symlink.
+                if os.path.islink(dest):
+                    os.unlink(dest)
+                exists = os.path.exists(dest)
+                shutil.copyfile(src_path, dest)
+                if not exists:
+                    os.chmod(dest, os.stat(src_path).st_mode & 0o777 & ~umask)
+                copy_times(src_path, dest)
+    for src_dir, dest_dir in reversed(dirs_copied):
+        copy_times(src_dir, dest_dir)
+
+
+def remove_path(path):
+    """Remove a file, symlink or directory tree if it exists."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def copy_times(src, dest):
+    """Copy the access and modification times of a file or directory."""
+    st = os.stat(src)
+    os.utime(dest, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def path_lock(path):
+    """Get a lock for serializing concurrent operations on the same path."""
+    with path_locks_guard:
+        return path_locks[os.path.abspath(path)]
+
+
+def write_json(path, data):
+    """Atomically replace a file with the JSON representation of the data."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class JsonStore:
+    """A dict that is loaded from and saved to a JSON file and can be shared between threads."""
+
+    def __init__(self, path):
+        """Load the entries from the file (if it exists)."""
+        self.path = path
+        self.lock = threading.Lock()
+        self.changed = False
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def get(self, key, default=None):
+        """Get the value stored for a key."""
+        with self.lock:
+            return self.entries.get(key, default)
+
+    def set(self, key, value):
+        """Store a value for a key."""
+        with self.lock:
+            self.entries[key] = value
+            self.changed = True
+
+    def save(self):
+        """Write the entries back to the file if they were changed."""
+        with self.lock:
+            if not self.changed or not os.path.isdir(os.path.dirname(self.path)):
+                return
+            write_json(self.path, self.entries)
+            self.changed = False
@@ -1,13 +1,26 @@
 """Tests objects."""
 
+import hashlib
+import json
 import os.path
 import pathlib
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase, mock
 
 import pytest
 
-from drupy import objects, utils
-from drupy.objects import DrupalOrgProject, TarballExtract, UrllibDownloader
+from drupy import objects
+from drupy.objects import (
+    DirectoryApplier,
+    DownloadManifest,
+    DrupalOrgProject,
+    LocalDownloader,
+    TarballExtract,
+    UrllibDownloader,
+)
 
 
 def test_loading_yaml_config():
@@ -19,6 +32,142 @@ def test_loading_yaml_config():
     assert data == {"foo": 42}
 
 
+def fake_config_runner():
+    """Create a runner mock that is able to read local config files."""
+    runner = mock.Mock(options=mock.Mock(verbose=False))
+    runner.get_downloader.side_effect = lambda config: LocalDownloader(runner, config)
+    return runner
+
+
+def test_tree_sites(temp_dir):
+    """Test finding site configs next to the project config."""
+    root = pathlib.Path(temp_dir)
+    root.joinpath("project.json").write_text('{"projects": {}}', encoding="utf-8")
+    root.joinpath("example.site.json").write_text('{"profile": "minimal"}', encoding="utf-8")
+    root.joinpath(".hidden.site.json").write_text("{}", encoding="utf-8")
+    root.joinpath("example.txt").write_text("", encoding="utf-8")
+    root.joinpath("other.site.json.orig").write_text("", encoding="utf-8")
+    tree = objects.Tree(fake_config_runner(), str(root / "project.json"))
+    assert list(tree.sites) == ["example"]
+    assert tree.sites["example"].config["profile"] == "minimal"
+    assert tree.sites["example"].config["db-url"] == "dpl:dplpw@localhost/example"
+
+
+def test_tree_sites_are_read_lazily(temp_dir):
+    """Site configs are only read when the site is accessed."""
+    root = pathlib.Path(temp_dir)
+    root.joinpath("project.json").write_text('{"projects": {}}', encoding="utf-8")
+    root.joinpath("broken.site.json").write_text("{", encoding="utf-8")
+    tree = objects.Tree(fake_config_runner(), str(root / "project.json"))
+    assert list(tree.sites) == ["broken"]
+    with pytest.raises(ValueError):
+        tree.sites["broken"]  # pylint: disable=pointless-statement
+
+
+def test_typed_factory_caches_types():
+    """The type is chosen once per config, but each call gets a new object."""
+    runner = mock.Mock(options=mock.Mock(verbose=False))
+    factory = objects.TypedFactory(
+        runner, "Downloader", [objects.ScmNoopDownloader, LocalDownloader], cache_types=True
+    )
+    with mock.patch.object(objects.ScmNoopDownloader, "accepts", return_value=False) as accepts:
+        first = factory.produce({"url": "common.json"}).download("a", None)
+        second = factory.produce({"url": "common.json"}).download("b", None)
+    assert isinstance(second, LocalDownloader)
+    assert first.localpath() == os.path.join("a", "common.json")
+    assert second.localpath() == os.path.join("b", "common.json")
+    accepts.assert_called_once_with({"url": "common.json"})
+
+
+def test_read_config_includes(temp_dir):
+    """Includes are merged level by level in the order they are listed."""
+    root = pathlib.Path(temp_dir)
+    files = {
+        "project.json": {"includes": ["a.json", "b.json"], "x": 0},
+        "a.json": {"includes": ["c.json"], "x": 1, "y": "a"},
+        "b.json": {"y": "b", "z": "b"},
+        "c.json": {"z": "c", "w": "c"},
+    }
+    for name, content in files.items():
+        root.joinpath(name).write_text(json.dumps(content), encoding="utf-8")
+    runner = fake_config_runner()
+    with ThreadPoolExecutor(max_workers=2) as runner.state.download_pool:
+        config = objects.Config(runner, str(root / "project.json"))
+    assert config.config == {"x": 0, "y": "a", "z": "b", "w": "c"}
+
+
+def test_read_config_same_named_includes(temp_dir):
+    """Includes with the same relative name in different directories are read separately."""
+    root = pathlib.Path(temp_dir)
+    files = {
+        "project.json": {"includes": ["a/x.json", "b/x.json"]},
+        "a/x.json": {"includes": ["common.json"]},
+        "b/x.json": {"includes": ["common.json"]},
+        "a/common.json": {"a": True},
+        "b/common.json": {"b": True},
+    }
+    for name, content in files.items():
+        root.joinpath(name).parent.mkdir(exist_ok=True)
+        root.joinpath(name).write_text(json.dumps(content), encoding="utf-8")
+    runner = mock.Mock(options=mock.Mock(verbose=False))
+    factory = objects.TypedFactory(
+        runner,
+        "Downloader",
+        [objects.ScmNoopDownloader, UrllibDownloader, LocalDownloader],
+        cache_types=True,
+    )
+    runner.get_downloader = factory.produce
+
+    download = LocalDownloader.download
+
+    def slow_download(self, rel_to, store):
+        """Give concurrent fetches a chance to interleave."""
+        result = download(self, rel_to, store)
+        time.sleep(0.01)
+        return result
+
+    with mock.patch.object(LocalDownloader, "download", slow_download):
+        with ThreadPoolExecutor(max_workers=2) as runner.state.download_pool:
+            config = objects.Config(runner, str(root / "project.json"))
+    assert config.config == {"a": True, "b": True}
+
+
+def test_read_yaml_file_cached(temp_dir):
+    """Parsed YAML files are cached until they are modified."""
+    root = pathlib.Path(temp_dir)
+    path = root / "project.yaml"
+    path.write_text("projects: {}\n", encoding="utf-8")
+    runner = fake_config_runner()
+    runner.options.download_dir = str(root / "downloads")
+    config = objects.Config(runner, str(path))
+    assert config.config == {"projects": {}}
+
+    with mock.patch.dict(objects.parsers, {".yaml": mock.Mock(side_effect=AssertionError)}):
+        assert config.read_file(str(path)) == {"projects": {}}
+
+    path.write_text("projects: {a: {}}\n", encoding="utf-8")
+    assert config.read_file(str(path)) == {"projects": {"a": {}}}
+
+
+def test_site_projects(temp_dir):
+    """Each project linked by a site is listed once."""
+    path = pathlib.Path(temp_dir) / "example.site.json"
+    links = {"modules": {"a": "a-7.x-1.0", "b": "libs/b", "sub": {"c": "a-7.x-1.0/sub"}}}
+    path.write_text(json.dumps({"links": links}), encoding="utf-8")
+    site = objects.Site(fake_config_runner(), "example", str(path))
+    assert list(site.projects()) == ["a-7.x-1.0", "libs"]
+
+
+def test_add_defaults():
+    """Test merging nested defaults into a config."""
+    defaults = {"a": 1, "b": {"c": 2, "d": {"e": 3}}, "f": []}
+    config = {"a": 0, "b": {"d": {}}}
+    objects.add_defaults(config, defaults)
+    assert config == {"a": 0, "b": {"c": 2, "d": {"e": 3}}, "f": []}
+    config["f"].append(4)
+    assert not defaults["f"]
+
+
 class DrupalOrgProjectTest(TestCase):
     """Test the object for drupal.org projects."""
 
@@ -66,14 +215,141 @@ class DrupalOrgProjectTest(TestCase):
         p = DrupalOrgProject(None, {"dirname": "testitt"})
         assert not p.is_valid()
 
+    def test_accepts(self):
+        """Test the cheap pre-check used by the project factory."""
+        assert DrupalOrgProject.accepts({"dirname": "campaignion-7.x-1.0+pr32"})
+        assert DrupalOrgProject.accepts({"dirname": "testitt", "type": "drupal.org"})
+        assert not DrupalOrgProject.accepts({"dirname": "testitt"})
+        assert not DrupalOrgProject.accepts({"dirname": "campaignion-7.x-1.0", "type": "git"})
+
+
+def test_urllib_downloader_cached_file(temp_dir):
+    """A previously downloaded file is reused if its hash matches."""
+    content = b"cached content"
+    sha1 = hashlib.sha1(content).hexdigest()
+    manifest = DownloadManifest(os.path.join(temp_dir, ".dbuild-cache.json"))
+    fake_runner = mock.Mock(options=mock.Mock(verbose=False))
+    fake_runner.state.download_manifest = manifest
+    dl = UrllibDownloader(fake_runner, config={"url": f"https://example.com/file.tar#{sha1}"})
+    path = pathlib.Path(temp_dir) / "https---example.com-file.tar"
+    path.write_bytes(content)
+    with mock.patch("urllib.request.urlopen") as urlopen:
+        assert dl.download("", temp_dir).localpath() == str(path)
+    urlopen.assert_not_called()
+    assert dl.get_hash() == sha1
+    assert manifest.get_hash(str(path)) == sha1
+
+
+def test_download_manifest(temp_dir):
+    """Test that recorded hashes are persisted and invalidated on changes."""
+    path = pathlib.Path(temp_dir) / "file"
+    path.write_bytes(b"content")
+    manifest = DownloadManifest(os.path.join(temp_dir, ".dbuild-cache.json"))
+    manifest.record(str(path), "sha1")
+    manifest.save()
+
+    manifest = DownloadManifest(os.path.join(temp_dir, ".dbuild-cache.json"))
+    assert manifest.get_hash(str(path)) == "sha1"
+    path.write_bytes(b"changed content")
+    assert manifest.get_hash(str(path)) is None
+
+
+def test_directory_applier(temp_dir):
+    """Test copying a directory into an existing target directory."""
+    source = pathlib.Path(temp_dir) / "source"
+    source.joinpath("sub").mkdir(parents=True)
+    source.joinpath("sub", "file").write_text("content", encoding="utf-8")
+    source.joinpath("link").symlink_to("sub/file")
+    target = pathlib.Path(temp_dir) / "target"
+    target.mkdir()
+    target.joinpath("existing").touch()
+
+    runner = mock.Mock(options=mock.Mock(umask=0o022))
+    applier = DirectoryApplier(runner, {"localpath": str(source)})
+    assert applier.is_valid()
+    applier.apply_to(str(target))
+    assert target.joinpath("existing").exists()
+    assert target.joinpath("sub", "file").read_text(encoding="utf-8") == "content"
+    assert os.readlink(target / "link") == "sub/file"
+
+
+def test_directory_applier_overlay(temp_dir):
+    """Copying onto an existing tree replaces files and links but not permissions."""
+    source = pathlib.Path(temp_dir) / "source"
+    source.mkdir()
+    source.joinpath("file").write_text("new", encoding="utf-8")
+    source.joinpath("file").chmod(0o600)
+    source.joinpath("link").symlink_to("file")
+    source.joinpath("script").write_text("#!/bin/sh\n", encoding="utf-8")
+    source.joinpath("script").chmod(0o755)
+    os.utime(source / "file", (1000000000, 1000000000))
+    target = pathlib.Path(temp_dir) / "target"
+    target.mkdir()
+    target.joinpath("file").write_text("old", encoding="utf-8")
+    target.joinpath("file").chmod(0o644)
+    target.joinpath("link").write_text("not a link", encoding="utf-8")
+
+    runner = mock.Mock(options=mock.Mock(umask=0o027))
+    DirectoryApplier(runner, {"localpath": str(source)}).apply_to(str(target))
+    assert target.joinpath("file").read_text(encoding="utf-8") == "new"
+    assert target.joinpath("file").stat().st_mode & 0o777 == 0o644
+    assert target.joinpath("file").stat().st_mtime == 1000000000
+    assert os.readlink(target / "link") == "file"
+    assert target.joinpath("script").stat().st_mode & 0o777 == 0o750
+
 
 class TarballExtractTest:
     """Test extracting a tarball."""
 
+    @staticmethod
+    def create_source_tree(temp_dir):
+        """Create a directory with some files to be archived."""
+        source = pathlib.Path(temp_dir) / "src" / "project-1.0"
+        source.joinpath("includes").mkdir(parents=True)
+        source.joinpath("project.module").write_text("module", encoding="utf-8")
+        source.joinpath("includes", "lib.inc").write_text("lib", encoding="utf-8")
+        source.joinpath("README.txt").write_text("readme", encoding="utf-8")
+        source.joinpath("link.inc").symlink_to("includes/lib.inc")
+        return source
+
+    def test_local_tarball(self, temp_dir):
+        """Test extracting a local tarball, stripping the prefix and excluding files."""
+        source = self.create_source_tree(temp_dir)
+        archive = os.path.join(temp_dir, "project-1.0.tar.gz")
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(source, arcname="project-1.0")
+        target = pathlib.Path(temp_dir) / "target"
+        runner = mock.Mock(options=mock.Mock(umask=0o022))
+        ex = TarballExtract(runner, config={"localpath": archive, "exclude": ["^README"]})
+        assert ex.is_valid()
+        ex.apply_to(str(target))
+        assert target.joinpath("project.module").read_text(encoding="utf-8") == "module"
+        assert target.joinpath("includes", "lib.inc").read_text(encoding="utf-8") == "lib"
+        assert target.joinpath("link.inc").read_text(encoding="utf-8") == "lib"
+        assert not target.joinpath("README.txt").exists()
+        assert not [p for p in os.listdir(temp_dir) if p.startswith(".extract-")]
+        assert not [p for p in os.listdir(target) if p.startswith(".extract-")]
+
+    def test_local_zip(self, temp_dir):
+        """Test extracting a local zip file."""
+        source = self.create_source_tree(temp_dir)
+        archive = os.path.join(temp_dir, "project-1.0.zip")
+        with zipfile.ZipFile(archive, "w") as z:
+            for path in sorted(source.rglob("*")):
+                z.write(path, arcname=path.relative_to(source.parent).as_posix())
+        target = pathlib.Path(temp_dir) / "target"
+        ex = TarballExtract(
+            mock.Mock(options=mock.Mock(umask=0o022)), config={"localpath": archive}
+        )
+        ex.apply_to(str(target))
+        assert target.joinpath("project.module").read_text(encoding="utf-8") == "module"
+        assert target.joinpath("includes", "lib.inc").read_text(encoding="utf-8") == "lib"
+        assert target.joinpath("README.txt").exists()
+
     @staticmethod
     def test_libraries(temp_dir):
         """Test whether the top-level directory is properly stripped."""
-        fake_runner = mock.Mock(options=mock.Mock(verbose=False))
+        fake_runner = mock.Mock(options=mock.Mock(verbose=False, umask=0o022))
         dl = UrllibDownloader(
             fake_runner,
             config={"url": "https://ftp.drupal.org/files/projects/libraries-7.x-2.3.tar.gz"},
@@ -87,7 +363,7 @@ class TarballExtractTest:
     @staticmethod
     def test_highcharts(temp_dir):
         """Highcharts is a zip-file without any directories to strip."""
-        fake_runner = mock.Mock(options=mock.Mock(verbose=False))
+        fake_runner = mock.Mock(options=mock.Mock(verbose=False, umask=0o022))
         dl = UrllibDownloader(
             fake_runner, config={"url": "http://code.highcharts.com/zips/Highcharts-4.2.7.zip"}
         )
@@ -100,7 +376,7 @@ class TarballExtractTest:
     @staticmethod
     def test_normalizing_permissions(temp_dir):
         """Check if permissions are normalized for ckeditor-4.16.1."""
-        fake_runner = mock.Mock(options=mock.Mock(verbose=False))
+        fake_runner = mock.Mock(options=mock.Mock(verbose=False, umask=0o022))
         ckeditor_url = (
             "https://download.cksource.com/CKEditor/CKEditor/"
             "CKEditor%204.16.1/ckeditor_4.16.1_standard.zip"
@@ -110,5 +386,4 @@ class TarballExtractTest:
             fake_runner, config={"localpath": dl.download("", temp_dir).localpath()}
         )
         ex.apply_to(temp_dir)
-        umask = utils.get_umask()
-        assert pathlib.Path(temp_dir).joinpath("skins").stat().st_mode & 0o777 == 0o777 & ~umask
+        assert pathlib.Path(temp_dir).joinpath("skins").stat().st_mode & 0o777 == 0o755
@@ -0,0 +1,124 @@
+"""Tests for the dependency resolver."""
+
+from unittest import mock
+
+from drupy import resolver
+
+
+class RecordingTarget(resolver.Target):
+    """Target that records the order in which targets are built."""
+
+    def __init__(self, runner, name, deps=(), log=None):
+        """Create a new recording target."""
+        super().__init__(runner)
+        self.name = name
+        self.configured_deps = list(deps)
+        self.log = log if log is not None else []
+
+    def dependencies(self):
+        """Return the configured dependencies."""
+        return self.configured_deps
+
+    def build(self):
+        """Record that this target was built."""
+        self.log.append(self.name)
+
+    def __repr__(self):
+        """Generate a string representation of this target."""
+        return f"RecordingTarget({self.name})"
+
+
+def fake_runner(**options):
+    """Create a runner mock with default options."""
+    defaults = {
+        "jobs": 4,
+        "debug": False,
+        "verbose": False,
+        "rebuild": False,
+        "update": False,
+        "dry_run": False,
+    }
+    defaults.update(options)
+    return mock.Mock(options=mock.Mock(**defaults))
+
+
+def test_execute_respects_dependencies():
+    """Dependencies are built exactly once and before their dependents."""
+    runner = fake_runner()
+    log = []
+    base = RecordingTarget(runner, "base", log=log)
+    projects = [RecordingTarget(runner, f"p{i}", [base], log) for i in range(8)]
+    site = RecordingTarget(runner, "site", projects, log)
+
+    r = resolver.Resolver(runner.options)
+    r.resolve([site])
+    r.execute()
+
+    assert log[0] == "base"
+    assert sorted(log[1:-1]) == sorted(p.name for p in projects)
+    assert log[-1] == "site"
+
+
+def test_dry_run_builds_nothing():
+    """A dry run skips all builds."""
+    runner = fake_runner(dry_run=True)
+    log = []
+    target = RecordingTarget(runner, "a", [RecordingTarget(runner, "b", log=log)], log)
+
+    r = resolver.Resolver(runner.options)
+    r.resolve([target])
+    r.execute()
+
+    assert not log
+
+
+def test_deps_are_computed_once():
+    """Target.deps calls dependencies() only once and caches the result as a tuple."""
+    runner = fake_runner()
+    dep = RecordingTarget(runner, "dep")
+    target = RecordingTarget(runner, "target", [dep])
+    with mock.patch.object(target, "dependencies", wraps=target.dependencies) as dependencies:
+        assert target.deps == (dep,)
+        assert target.deps == (dep,)
+    dependencies.assert_called_once_with()
+
+
+def test_get_reuses_targets():
+    """Targets constructed via get() are shared per runner and arguments."""
+    runner = fake_runner()
+    runner.state.targets = {}
+    assert RecordingTarget.get(runner, "a") is RecordingTarget.get(runner, "a")
+    assert RecordingTarget.get(runner, "a") is not RecordingTarget.get(runner, "b")
+
+
+def test_execute_starts_critical_path_first():
+    """Ready targets with the longest remaining path are built first."""
+    runner = fake_runner(jobs=1)
+    log = []
+    short = RecordingTarget(runner, "short", log=log)
+    long = RecordingTarget(runner, "long", log=log)
+    middle = RecordingTarget(runner, "middle", [long], log)
+    final = RecordingTarget(runner, "final", [middle, short], log)
+
+    r = resolver.Resolver(runner.options)
+    r.resolve([final])
+    r.execute()
+    assert log[0] == "long"
+
+    timings = resolver.Timings("/nonexistent/timings.json")
+    timings.record(repr(short), 60.0)
+    log.clear()
+    r = resolver.Resolver(runner.options, timings)
+    r.resolve([final])
+    r.execute()
+    assert log[0] == "short"
+
+
+def test_timings_roundtrip(tmp_path):
+    """Build times are persisted between runs."""
+    path = str(tmp_path / "timings.json")
+    timings = resolver.Timings(path)
+    assert timings.get("a") == 1.0
+    timings.record("a", 2.5)
+    timings.save()
+    assert resolver.Timings(path).get("a") == 2.5
@@ -0,0 +1,59 @@
+"""Tests for the build targets."""
+
+import os
+import pathlib
+from unittest import mock
+
+import pytest
+
+from drupy import targets
+
+
+def test_read_hash(temp_dir):
+    """Test reading hash files and detecting changes to them."""
+    path = pathlib.Path(temp_dir) / ".dbuild-hash"
+    assert targets.read_hash(str(path)) is None
+
+    path.write_text("abc", encoding="utf-8")
+    assert targets.read_hash(str(path)) == "abc"
+
+    # Files with the same size and mtime are still read again.
+    st = path.stat()
+    path.write_text("efg", encoding="utf-8")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert targets.read_hash(str(path)) == "efg"
+
+
+def test_build_project_keeps_old_build_if_rename_fails(temp_dir):
+    """The replaced build is only removed once the new build is in place."""
+    options = mock.Mock(projects_path=temp_dir, debug=False)
+    project = mock.Mock(hash="abc")
+    project.build.side_effect = os.makedirs
+    runner = mock.Mock(options=options)
+    runner.config.projects = {"example": project}
+    target = targets.BuildProjectTarget(runner, "example")
+    os.makedirs(target.target)
+
+    rename = os.rename
+
+    def failing_rename(src, dst):
+        if dst == target.target:
+            raise OSError("rename failed")
+        rename(src, dst)
+
+    with mock.patch("os.rename", failing_rename), pytest.raises(OSError):
+        target.build()
+    assert os.path.isdir(target.delete)
+    runner.state.remove_tree.assert_called_once_with(target.target + ".abc")
+
+
+def test_db_install_already_built(temp_dir):
+    """A site with a settings.php is considered installed."""
+    options = mock.Mock(install_dir=temp_dir, document_root="htdocs")
+    target = targets.DBInstallTarget(mock.Mock(options=options), "example")
+    assert not target.already_built()
+
+    site = pathlib.Path(temp_dir) / "htdocs" / "sites" / "example"
+    site.mkdir(parents=True)
+    site.joinpath("settings.php").write_text("<?php\n", encoding="utf-8")
+    assert target.already_built()
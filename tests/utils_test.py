@@ -14,9 +14,8 @@ def test_normalize_permissions(temp_dir):
     root.joinpath("file").touch(mode=0o600)
     root.joinpath("dir", "sub", "file").touch(mode=0o666)
 
-    os.umask(0o22)
-    utils.normalize_permissions(temp_dir)
     os.umask(original_chmod)
+    utils.normalize_permissions(temp_dir, 0o22)
     assert root.joinpath("dir").stat().st_mode & 0o777 == 0o755
     assert root.joinpath("dir", "sub").stat().st_mode & 0o777 == 0o755
     assert root.joinpath("file").stat().st_mode & 0o777 == 0o644